@@ -1,13 +1,13 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import os
-from utils import compute_final_risk, store_classification_to_blockchain, extract_domain_from_email
-# from blockchain_integration import get_blockchain_instance
+from utils import compute_final_risk, compute_final_risk_batch, store_classification_to_blockchain, extract_domain_from_email, cache_stats, warm_up_models
 from blockchain_integration import get_blockchain_instance  
 import logging
 import re
 from urllib.parse import urlparse
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 app = Flask(__name__)
 CORS(app)  # allow cross-origin calls from extension (restrict in production)
@@ -23,6 +23,9 @@ if os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# utils loads its models lazily; the server loads them up front so the first request isn't slow
+warm_up_models()
+
 API_KEY = os.environ.get("EXT_API_KEY", "")
 print(f"API KEY: {API_KEY}")
 
@@ -30,14 +33,22 @@ print(f"API KEY: {API_KEY}")
 AUTO_REPORT_TO_BLOCKCHAIN = os.environ.get("AUTO_REPORT_CONFIDENT_CLASSIFICATIONS", "true").lower() == "true"
 MIN_CONFIDENCE_FOR_BLOCKCHAIN = float(os.environ.get("MIN_CONFIDENCE_FOR_BLOCKCHAIN_REPORT", "0.8"))
 
+# Each batch email costs one Gemini call; larger batches are rejected
+MAX_BATCH_EMAILS = int(os.environ.get("MAX_BATCH_EMAILS", "20"))
+# Batch auto-reports are wallet transactions (up to 60 s each); they run here, one at a
+# time, instead of in the request thread
+_auto_report_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="auto-report")
+
+# Compiled once at import rather than looked up in re's cache per call
+URL_PATTERN = re.compile(r'https?://[^\s<>"{}|\\^`\[\]]+|www\.[^\s<>"{}|\\^`\[\]]+', re.IGNORECASE)
+
 def extract_domains_from_content(content):
     """Extract domains from email content"""
     if not content:
         return []
     
     # Find URLs in content
-    url_pattern = r'https?://[^\s<>"{}|\\^`\[\]]+|www\.[^\s<>"{}|\\^`\[\]]+'
-    urls = re.findall(url_pattern, content, re.IGNORECASE)
+    urls = URL_PATTERN.findall(content)
     
     domains = set()
     for url in urls:
@@ -151,6 +162,45 @@ def analyze():
     # Call your compute_final_risk which returns (final_risk, details)
     final_risk, details = compute_final_risk(body, sender=sender, subject=subject, force_llm=force_llm)
     
+    resp = build_analysis_response(final_risk, details, sender, force_llm)
+    logger.info(f"Analysis complete: risk={final_risk:.3f}, from_previous_incident={resp['from_previous_incident']}")
+    return jsonify(resp)
+
+@app.route("/analyze/batch", methods=["POST"])
+def analyze_batch():
+    """Analyze several emails in one call (one embedding batch, one URL model call)"""
+    if API_KEY:
+        key = request.headers.get("x-api-key", "")
+        if key != API_KEY:
+            return jsonify({"error": "invalid api key"}), 403
+    
+    data = request.get_json() or {}
+    emails = data.get("emails", [])
+    force_llm = data.get("force_llm", False)
+    
+    if not isinstance(emails, list) or not emails or not all(isinstance(email, dict) for email in emails):
+        return jsonify({"error": "emails must be a non-empty list of objects"}), 400
+    if len(emails) > MAX_BATCH_EMAILS:
+        return jsonify({"error": f"at most {MAX_BATCH_EMAILS} emails per batch"}), 400
+    if any(not isinstance(email.get(field, ""), str) for email in emails for field in ("sender", "subject", "body")):
+        return jsonify({"error": "sender, subject and body must be strings"}), 400
+    
+    logger.info(f"Analyzing batch of {len(emails)} emails (force_llm={force_llm})")
+    
+    results = compute_final_risk_batch(emails, force_llm=force_llm)
+    
+    return jsonify({
+        "results": [
+            build_analysis_response(final_risk, details, email.get("sender", ""), force_llm, defer_report=True)
+            for email, (final_risk, details) in zip(emails, results)
+        ]
+    })
+
+def build_analysis_response(final_risk, details, sender="", force_llm=False, defer_report=False):
+    """Auto-report the sender if applicable and shape one analysis result for the API
+
+    defer_report queues the auto-report on a background thread instead of waiting for it.
+    """
     # Ensure actions exist
     actions = details.get("llm_actions") or details.get("actions") or ["No actions required"]
     llm_reason = details.get("llm_reason", "")
@@ -160,17 +210,21 @@ def analyze():
     if sender and not force_llm:
         logger.info(f"Sender email: {sender}")
         try:
-            auto_report_domains_to_blockchain(
-                domains=[],  # Not used anymore, kept for compatibility
-                final_risk=final_risk,
-                llm_reason=llm_reason,
-                sender=sender
-            )
+            report_kwargs = {
+                "domains": [],  # Not used anymore, kept for compatibility
+                "final_risk": final_risk,
+                "llm_reason": llm_reason,
+                "sender": sender
+            }
+            if defer_report:
+                _auto_report_executor.submit(auto_report_domains_to_blockchain, **report_kwargs)
+            else:
+                auto_report_domains_to_blockchain(**report_kwargs)
         except Exception as e:
             logger.error(f"Error in auto-reporting to blockchain: {e}")
     
     # Respond with sanitized JSON including blockchain data
-    resp = {
+    return {
         "final_risk": final_risk,
         "details": details,
         "llm_actions": actions,
@@ -183,9 +237,6 @@ def analyze():
         "from_previous_incident": details.get("blockchain_signals", {}).get("from_previous_incident", False),
         "force_llm_used": force_llm
     }
-    
-    logger.info(f"Analysis complete: risk={final_risk:.3f}, from_previous_incident={resp['from_previous_incident']}")
-    return jsonify(resp)
 
 @app.route("/blockchain/status", methods=["GET"])
 def blockchain_status():
@@ -412,7 +463,8 @@ def admin_stats():
         "auto_reporting_enabled": AUTO_REPORT_TO_BLOCKCHAIN,
         "min_confidence_threshold": MIN_CONFIDENCE_FOR_BLOCKCHAIN,
         "mode": "admin_only_system",
-        "blockchain_connected": get_blockchain_instance().get_connection_status().get("connected", False)
+        "blockchain_connected": get_blockchain_instance().get_connection_status().get("connected", False),
+        "caches": cache_stats()
     })
 
 if __name__ == "__main__":
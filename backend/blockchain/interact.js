@@ -1,8 +1,15 @@
 import { ethers } from "ethers";
 import dotenv from "dotenv";
 import path from "path";
+import readline from "readline";
 import { fileURLToPath } from "url";
 
+// In serve mode stdout carries the JSON-lines protocol, so route logs to stderr
+const SERVE_MODE = process.argv[2] === "serve";
+if (SERVE_MODE) {
+  console.log = console.error;
+}
+
 const __filename = fileURLToPath(import.meta.url);
 const __dirname = path.dirname(__filename);
 
@@ -462,6 +469,59 @@ async function testContract() {
   }, 5000);
 }
 
+// Persistent worker: one JSON request per stdin line, one JSON reply per stdout line.
+// Provider, wallet and contract are created once at startup and reused for every request.
+async function serve(contract) {
+  const reply = (msg) => process.stdout.write(JSON.stringify(msg) + "\n");
+
+  // Connect the provider up front so the first real query is warm
+  const warmUp = contract.provider
+    ? contract.provider.getNetwork().catch((error) => {
+        console.error("⚠️ Provider warm-up failed:", error.message);
+      })
+    : Promise.resolve();
+
+  // Transactions from one wallet must not overlap (nonce / cooldown), queries may
+  let txQueue = Promise.resolve();
+
+  const handle = async (request) => {
+    switch (request.op) {
+      case "ping":
+        await warmUp;
+        return { ready: true };
+      case "query":
+        return { result: await contract.getDomainClassification(request.domain) };
+      case "classify": {
+        const run = () =>
+          contract.classifyDomain(request.domain, Boolean(request.isSpam), request.reason || "");
+        const pending = txQueue.then(run, run);
+        txQueue = pending.catch(() => null);
+        return { result: await pending };
+      }
+      default:
+        throw new Error(`Unknown op: ${request.op}`);
+    }
+  };
+
+  const rl = readline.createInterface({ input: process.stdin });
+  rl.on("line", async (line) => {
+    if (!line.trim()) return;
+    let request;
+    try {
+      request = JSON.parse(line);
+    } catch (error) {
+      reply({ id: null, ok: false, error: `Invalid JSON: ${error.message}` });
+      return;
+    }
+    try {
+      reply({ id: request.id, ok: true, ...(await handle(request)) });
+    } catch (error) {
+      reply({ id: request.id, ok: false, error: error.message });
+    }
+  });
+  rl.on("close", () => process.exit(0));
+}
+
 // CLI interface
 console.log("🔍 Debug info:");
 console.log("import.meta.url:", import.meta.url);
@@ -493,6 +553,9 @@ if (args.length === 0) {
   console.log(
     "  node interact.js cooldown                   - Get cooldown information"
   );
+  console.log(
+    "  node interact.js serve                      - Run as persistent JSON-lines worker"
+  );
   process.exit(0);
 }
 
@@ -548,10 +611,14 @@ try {
       await contract.getCooldownInfo();
       break;
 
+    case "serve":
+      await serve(contract);
+      break;
+
     default:
       console.log("Unknown command:", command);
       console.log(
-        "Available commands: test, classify, query, list, stats, check, cooldown"
+        "Available commands: test, classify, query, list, stats, check, cooldown, serve"
       );
       process.exit(1);
   }
@@ -1,9 +1,22 @@
 import os
+import json
+import queue
+import itertools
+import threading
 import subprocess
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Fast JSON for the worker channel (bytes in / bytes out); stdlib fallback
+try:
+    import orjson
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+except ImportError:
+    def _json_dumps(obj): return json.dumps(obj).encode('utf-8')
+    _json_loads = json.loads
+
 class BlockchainInstance:
     def __init__(self):
         self.connected = False
@@ -22,6 +35,16 @@ class BlockchainInstance:
             "account_address": self.account_address
         }
     
+    def _query_worker(self, domain):
+        """On-chain record from the persistent worker ({} if the lookup failed), None without a worker"""
+        worker = get_blockchain_worker()
+        if worker is None:
+            return None
+        response = worker.request({"op": "query", "domain": domain}, timeout=15)
+        if not response.get("ok"):
+            logger.warning(f"Blockchain worker query failed: {str(response.get('error'))[:100]}")
+        return (response.get("result") if response.get("ok") else None) or {}
+
     def get_domain_classification(self, domain):
         """Get classification for a specific domain"""
         try:
@@ -29,6 +52,13 @@ class BlockchainInstance:
             if not os.path.exists(script_path):
                 logger.warning(f"Blockchain script not found at: {script_path}")
                 return {"domain": domain, "classification": "unknown", "confidence": 0.0}
+            
+            # Persistent worker returns the on-chain record itself
+            record = self._query_worker(domain)
+            if record is not None:
+                if record.get("exists"):
+                    return {"domain": domain, "classification": "spam" if record.get("isSpam") else "ham", "confidence": 1.0}
+                return {"domain": domain, "classification": "unknown", "confidence": 0.0}
                 
             result = subprocess.run(
                 ['node', script_path, 'query', domain],
@@ -57,6 +87,21 @@ class BlockchainInstance:
             if not os.path.exists(script_path):
                 logger.warning(f"Blockchain script not found at: {script_path}")
                 return {"exists": False}
+            
+            # Persistent worker returns the on-chain record itself
+            record = self._query_worker(domain)
+            if record is not None:
+                if not record.get("exists"):
+                    return {"exists": False}
+                is_spam = bool(record.get("isSpam"))
+                return {
+                    "exists": True,
+                    "reputation_score": 10 if is_spam else 90,
+                    "consensus": "spam" if is_spam else "ham",
+                    "spam_votes": 1 if is_spam else 0,
+                    "ham_votes": 0 if is_spam else 1,
+                    "total_reports": 1
+                }
                 
             result = subprocess.run(
                 ['node', script_path, 'reputation', domain],
@@ -106,4 +151,111 @@ def get_blockchain_instance():
         except Exception as e:
             logger.warning(f"Blockchain initialization failed: {e}")
             _blockchain_instance.connected = False
-    return _blockchain_instance
\ No newline at end of file
+    return _blockchain_instance
+
+class BlockchainWorker:
+    """Persistent `node interact.js serve` process speaking JSON lines over stdin/stdout
+
+    The pipes are binary: lines are parsed straight from bytes, no text decode step.
+    """
+
+    def __init__(self, script_path, ready_timeout=30):
+        self.script_path = script_path
+        self.proc = subprocess.Popen(
+            ['node', script_path, 'serve'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(script_path)  # Set working directory to blockchain folder
+        )
+        self._write_lock = threading.Lock()
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+        self._pin_cpu()
+
+        # Block until Node has built the provider/contract so the first real query is warm
+        try:
+            response = self.request({"op": "ping"}, timeout=ready_timeout)
+        except Exception:
+            self.close()
+            raise
+        if not response.get("ready"):
+            self.close()
+            raise RuntimeError(f"Blockchain worker not ready: {response.get('error')}")
+
+    def _pin_cpu(self):
+        """Pin the worker to BLOCKCHAIN_WORKER_CPU (if set) to avoid scheduler migration"""
+        cpu = os.getenv('BLOCKCHAIN_WORKER_CPU')
+        if cpu is None or not hasattr(os, 'sched_setaffinity'):
+            return
+        try:
+            os.sched_setaffinity(self.proc.pid, {int(cpu)})
+        except (ValueError, OSError) as e:
+            logger.warning(f"Could not pin blockchain worker to CPU {cpu}: {e}")
+
+    def _read_loop(self):
+        for line in self.proc.stdout:
+            try:
+                message = _json_loads(line)
+            except ValueError:
+                continue
+            waiter = self._pending.get(message.get("id"))
+            if waiter is not None:
+                waiter.put(message)
+        # Process exited: fail everything still waiting
+        for waiter in list(self._pending.values()):
+            waiter.put({"ok": False, "error": "Blockchain worker exited"})
+
+    def is_alive(self):
+        return self.proc.poll() is None
+
+    def request(self, payload, timeout=15):
+        """Send one request and wait for its reply; raises subprocess.TimeoutExpired on timeout"""
+        request_id = next(self._ids)
+        waiter = queue.Queue(maxsize=1)
+        self._pending[request_id] = waiter
+        try:
+            with self._write_lock:
+                self.proc.stdin.write(_json_dumps({"id": request_id, **payload}) + b"\n")
+                self.proc.stdin.flush()
+            return waiter.get(timeout=timeout)
+        except queue.Empty:
+            raise subprocess.TimeoutExpired(self.proc.args, timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+        except Exception:
+            pass
+        if self.is_alive():
+            self.proc.terminate()
+
+# Global worker
+_blockchain_worker = None
+_blockchain_worker_lock = threading.Lock()
+_blockchain_worker_failed = False
+
+def get_blockchain_worker():
+    """Get or start the persistent blockchain worker (None if it cannot be started)"""
+    global _blockchain_worker, _blockchain_worker_failed
+    with _blockchain_worker_lock:
+        if _blockchain_worker is not None and _blockchain_worker.is_alive():
+            return _blockchain_worker
+        if _blockchain_worker_failed:
+            return None
+        script_path = os.path.join(os.path.dirname(__file__), 'blockchain', 'interact.js')
+        if not os.path.exists(script_path):
+            _blockchain_worker_failed = True
+            return None
+        try:
+            _blockchain_worker = BlockchainWorker(script_path)
+            logger.info("✅ Blockchain worker started")
+        except Exception as e:
+            logger.warning(f"⚠️ Blockchain worker unavailable, falling back to per-call subprocess: {e}")
+            _blockchain_worker = None
+            _blockchain_worker_failed = True
+        return _blockchain_worker
@@ -0,0 +1,89 @@
+"""One-time ONNX exports used by utils when present
+
+- all-MiniLM-L6-v2 -> files/minilm_onnx/model.onnx (FP32, used by default) and
+  model_quantized.onnx (int8, used with QUANTIZE_EMBEDDING_MODEL=true) for OnnxSentenceEncoder
+- URL random forest -> files/random_forest_url_model.onnx (for OnnxUrlModel)
+- files/*.pkl -> re-saved in place with pickle.HIGHEST_PROTOCOL (faster startup loads)
+
+Usage (from the backend folder):
+    pip install "optimum[onnxruntime]" skl2onnx
+    python export_onnx_models.py            # both
+    python export_onnx_models.py encoder    # only the embedding model
+    python export_onnx_models.py url        # only the URL model
+    python export_onnx_models.py pickles    # only re-save the pickles (no extra deps)
+"""
+import os
+import sys
+import pickle
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+ENCODER_OUTPUT_DIR = os.path.join('files', 'minilm_onnx')
+URL_MODEL_PATH = os.path.join('files', 'random_forest_url_model.pkl')
+URL_MODEL_ONNX_PATH = os.path.join('files', 'random_forest_url_model.onnx')
+# Pickles loaded by utils at import time
+RUNTIME_PICKLES = [
+    os.path.join('files', 'X_train_encoded_columns.pkl'),
+    URL_MODEL_PATH,
+    os.path.join('files', 'email_log_reg_embed_model.pkl'),
+]
+
+def export_encoder(output_dir: str = ENCODER_OUTPUT_DIR):
+    """Export with dynamic batch/sequence axes, then quantize weights to int8"""
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    from transformers import AutoTokenizer
+    
+    os.makedirs(output_dir, exist_ok=True)
+    
+    model = ORTModelForFeatureExtraction.from_pretrained(MODEL_NAME, export=True)
+    model.save_pretrained(output_dir)
+    AutoTokenizer.from_pretrained(MODEL_NAME).save_pretrained(output_dir)
+    logger.info("✅ Exported FP32 ONNX model to %s", output_dir)
+    
+    quantize_dynamic(
+        os.path.join(output_dir, 'model.onnx'),
+        os.path.join(output_dir, 'model_quantized.onnx'),
+        weight_type=QuantType.QInt8
+    )
+    logger.info("✅ Wrote int8 model to %s", os.path.join(output_dir, 'model_quantized.onnx'))
+
+def export_url_model(model_path: str = URL_MODEL_PATH, output_path: str = URL_MODEL_ONNX_PATH):
+    """Convert the URL random forest; probabilities come out as a plain (N, 2) tensor"""
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType
+    
+    with open(model_path, 'rb') as f:
+        url_model = pickle.load(f)
+    
+    onnx_model = convert_sklearn(
+        url_model,
+        initial_types=[('X', FloatTensorType([None, url_model.n_features_in_]))],
+        options={id(url_model): {'zipmap': False}}
+    )
+    with open(output_path, 'wb') as f:
+        f.write(onnx_model.SerializeToString())
+    logger.info("✅ Wrote URL model to %s", output_path)
+
+def resave_pickles(paths=RUNTIME_PICKLES):
+    """Rewrite each pickle with the newest protocol; the payload is unchanged"""
+    for path in paths:
+        with open(path, 'rb') as f:
+            obj = pickle.load(f)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        logger.info("✅ Re-saved %s with protocol %d", path, pickle.HIGHEST_PROTOCOL)
+
+if __name__ == "__main__":
+    targets = sys.argv[1:] or ['encoder', 'url', 'pickles']
+    if 'encoder' in targets:
+        export_encoder()
+    if 'url' in targets:
+        export_url_model()
+    if 'pickles' in targets:
+        resave_pickles()
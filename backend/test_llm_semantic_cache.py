@@ -0,0 +1,99 @@
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+import utils
+
+BENIGN = (
+    "Hi team, the quarterly report is ready. Please review the figures before Friday's "
+    "meeting and leave comments in the shared document: https://docs.example.com/report. "
+    "Thanks, Dana"
+)
+LINK_SWAPPED = BENIGN.replace("https://docs.example.com/report", "https://docs-example.phish.test/report")
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class _FakeLLM:
+    def __init__(self, reply):
+        self.reply = reply
+        self.calls = 0
+        self.events = []
+        self.called = threading.Event()
+
+    def generate_content(self, prompt, stream=False):
+        self.calls += 1
+        self.events.append("llm")
+        self.called.set()
+        return iter([_Chunk(self.reply)])
+
+
+def _use_llm(monkeypatch, llm):
+    monkeypatch.setattr(utils, "_llm_model", llm)
+    monkeypatch.setattr(utils, "_llm_model_loaded", True)
+    monkeypatch.setattr(utils, "_llm_result_cache", utils.LRUCache(maxsize=16))
+    monkeypatch.setattr(utils, "_llm_semantic_cache", utils.SemanticCache(maxsize=16, threshold=0.97))
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_link_swap_is_not_served_from_semantic_cache(monkeypatch):
+    llm = _FakeLLM("RISK_SCORE: 0.1\nREASON: routine\nCONFIDENCE: 0.9\n")
+    _use_llm(monkeypatch, llm)
+    embedding = _unit(np.ones(8))
+
+    utils.analyze_with_llm(BENIGN, "dana@example.com", "Q3 report", embedding=embedding)
+    utils.analyze_with_llm(LINK_SWAPPED, "dana@example.com", "Q3 report", embedding=embedding)
+
+    assert llm.calls == 2
+
+
+def test_near_duplicate_with_same_links_is_reused(monkeypatch):
+    llm = _FakeLLM("RISK_SCORE: 0.1\nREASON: routine\nCONFIDENCE: 0.9\n")
+    _use_llm(monkeypatch, llm)
+    embedding = _unit(np.ones(8))
+
+    utils.analyze_with_llm(BENIGN, "dana@example.com", "Q3 report", embedding=embedding)
+    result = utils.analyze_with_llm(BENIGN + " ", "dana@example.com", "Q3 report", embedding=embedding)
+
+    assert llm.calls == 1
+    assert result == (0.1, "routine", 0.9)
+
+
+def test_pending_embedding_does_not_delay_llm_call(monkeypatch):
+    llm = _FakeLLM("RISK_SCORE: 0.1\nREASON: routine\nCONFIDENCE: 0.9\n")
+    _use_llm(monkeypatch, llm)
+    embedding = Future()
+
+    def finish_embedding():
+        # The embedding only completes once the LLM has been called
+        llm.called.wait(timeout=10)
+        llm.events.append("embedding")
+        embedding.set_result(_unit(np.ones(8)))
+
+    worker = threading.Thread(target=finish_embedding)
+    worker.start()
+    utils.analyze_with_llm(BENIGN, "dana@example.com", "Q3 report", embedding=embedding)
+    worker.join()
+
+    assert llm.events == ["llm", "embedding"]
+    assert utils._llm_semantic_cache.stats()["size"] == 1
+
+
+class _BlockedChunk:
+    @property
+    def text(self):
+        raise ValueError("response was blocked")
+
+
+def test_blocked_last_chunk_keeps_streamed_fields():
+    reply = iter([_Chunk("RISK_SCORE: 0.8\nREASON: credential lure\n"), _Chunk("CONFIDENCE: 0.7"), _BlockedChunk()])
+
+    assert utils._read_llm_reply(reply) == "RISK_SCORE: 0.8\nREASON: credential lure\nCONFIDENCE: 0.7"
@@ -1,155 +1,153 @@
-# import pandas as pd
-# import tldextract
-# import re
-# from urllib.parse import urlparse
-
-
-# # Symbols and vowels
-# special_chars = ['.', '-', '_', '/', '?', '=', '@', '&', '!', ' ', '~', ',', '+', '*', '#', '$', '%']
-# vowels = "aeiou"
-
-# def count_chars(string, char_list):
-#     """Counts occurrences of characters from char_list in a string."""
-#     return [string.count(ch) for ch in char_list]
-
-# def extract_features(url):
-#     """
-#     Extracts common features from a given URL string.
-
-#     Args:
-#         url (str): The URL string to extract features from.
-
-#     Returns:
-#         tuple: A tuple containing extracted features and parsed URL components.
-#     """
-#     parsed = urlparse(url)
-#     ext = tldextract.extract(url)
-
-#     domain = parsed.hostname or ""
-#     path = parsed.path or ""
-#     query = parsed.query or ""
-#     scheme = parsed.scheme or ""
-#     netloc = parsed.netloc or ""
-#     hostname = parsed.hostname or ""
-#     port = parsed.port or -1
-
-#     full = url
-#     feature_list = []
-
-#     # Raw parsed fields
-#     feature_list.extend([scheme, netloc, path, query, hostname, port])
-
-#     # URL level
-#     feature_list.extend(count_chars(full, special_chars))
-#     feature_list.append(len(full))  # length_url
-
-#     # Domain level
-#     feature_list.extend(count_chars(domain, special_chars))
-#     feature_list.append(sum(domain.count(v) for v in vowels))
-#     feature_list.append(len(domain))
-#     feature_list.append(1 if re.match(r"^\d+\.\d+\.\d+\.\d+$", domain) else 0)
-#     feature_list.append(1 if 'client' in domain or 'server' in domain else 0)
-
-#     # Directory level
-#     feature_list.extend(count_chars(path, special_chars))
-#     feature_list.append(len(path))
-
-#     # File level
-#     file_name = path.split('/')[-1]
-#     feature_list.extend(count_chars(file_name, special_chars))
-#     feature_list.append(len(file_name))
-
-#     # Params level
-#     feature_list.extend(count_chars(query, special_chars))
-#     feature_list.append(len(query))
-#     feature_list.append(1 if any(tld in query for tld in ['.com', '.org', '.net']) else 0)
-#     feature_list.append(len(query.split('&')) if query else 0)
-#     feature_list.append(1 if 'mailto:' in url or 'email=' in url else 0)
-
-#     return feature_list, parsed, ext
-
-# def extract_localhost_features(url):
-#     """
-#     Extracts features specifically for localhost or 127.0.0.1 URLs.
-
-#     Args:
-#         url (str): The localhost URL string.
-
-#     Returns:
-#         list: A list of extracted features for localhost URLs.
-#     """
-#     features, parsed, ext = extract_features(url)
-#     # Add any specific localhost features here if needed in the future
-#     return features
-
-# def extract_generic_features(url):
-#     """
-#     Extracts features for generic URLs (not localhost or 127.0.0.1).
-
-#     Args:
-#         url (str): The generic URL string.
-
-#     Returns:
-#         list: A list of extracted features for generic URLs.
-#     """
-#     features, parsed, ext = extract_features(url)
-#     # Add any specific generic features here if needed in the future
-#     return features
-
-# def extract_domain_from_url(url):
-#     """Extract clean domain from URL for blockchain lookup"""
-#     try:
-#         parsed = urlparse(url if url.startswith(('http://', 'https://')) else f'http://{url}')
-#         domain = parsed.hostname or url
-        
-#         # Extract root domain
-#         ext = tldextract.extract(domain)
-#         if ext.domain and ext.suffix:
-#             return f"{ext.domain}.{ext.suffix}"
-#         return domain.lower()
-#     except:
-#         return url.lower()
-    
-# def check_domain_reputation(domain: str):
-#     """
-#     Quick blockchain lookup for a single domain
-#     Returns: True (spam), False (ham), None (unknown/error)
-#     """
-#     script_path = os.path.join(os.path.dirname(__file__), 'blockchain', 'interact.js')
+import os
+import subprocess
+import logging
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+import re
+import numpy as np
+
+# Optional Numba kernel for the special-character counts; falls back to np.bincount
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+# Symbols and vowels
+special_chars = ['.', '-', '_', '/', '?', '=', '@', '&', '!', ' ', '~', ',', '+', '*', '#', '$', '%']
+vowels = "aeiou"
+
+# Precompiled patterns for the per-URL hot loop (one C-level pass each)
+_IPV4_HOST = re.compile(r"^\d+\.\d+\.\d+\.\d+$")
+_TLD_IN_QUERY = re.compile(r"\.(?:com|org|net)")
+_EMAIL_IN_URL = re.compile(r"mailto:|email=")
+
+# Raw parsed fields that the URL model one-hot encodes (column "<field>_<value>")
+URL_CATEGORICAL_FIELDS = ['scheme', 'netloc', 'path', 'query', 'hostname']
+
+def _qty_names(section):
+    return [f"qty_{'space' if ch == ' ' else ch}_{section}" for ch in special_chars]
+
+# Training column names for the numeric part of extract_features, in output order
+URL_NUMERIC_FEATURES = (
+    ['port']
+    + _qty_names('url') + ['length_url']
+    + _qty_names('domain') + ['qty_vowels_domain', 'domain_length', 'domain_in_ip', 'server_client_domain']
+    + _qty_names('directory') + ['directory_length']
+    + _qty_names('file') + ['file_length']
+    + _qty_names('params') + ['params_length', 'tld_present_params', 'qty_params', 'email_in_url']
+)
+
+def count_chars(string, char_list):
+    """Counts occurrences of characters from char_list in a string."""
+    return [string.count(ch) for ch in char_list]
+
+# Characters counted per segment: special_chars, then vowels
+_COUNTED_CHARS = special_chars + list(vowels)
+
+# Byte -> index into _COUNTED_CHARS (-1 for everything else); all targets are ASCII,
+# so counting UTF-8 bytes gives the same result as counting characters
+_COUNTED_CHAR_LUT = np.full(256, -1, dtype=np.int8)
+for _i, _ch in enumerate(_COUNTED_CHARS):
+    _COUNTED_CHAR_LUT[ord(_ch)] = _i
+_COUNTED_CHAR_BYTES = np.array([ord(ch) for ch in _COUNTED_CHARS], dtype=np.intp)
+
+if njit is not None:
+    @njit(cache=True)
+    def _count_segments_kernel(data, bounds, lut, n_targets):
+        counts = np.zeros((bounds.shape[0] - 1, n_targets), dtype=np.int64)
+        for seg in range(bounds.shape[0] - 1):
+            for j in range(bounds[seg], bounds[seg + 1]):
+                k = lut[data[j]]
+                if k >= 0:
+                    counts[seg, k] += 1
+        return counts
+
+def count_segment_chars(segments):
+    """Counts of special_chars followed by vowels for each string in segments, in one pass over all of them"""
+    encoded = [segment.encode('utf-8', 'surrogatepass') for segment in segments]
+    lengths = [len(e) for e in encoded]
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    if njit is not None:
+        bounds = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=bounds[1:])
+        return _count_segments_kernel(data, bounds, _COUNTED_CHAR_LUT, len(_COUNTED_CHARS)).tolist()
     
-#     try:
-#         result = subprocess.run(
-#             ['node', script_path, 'query', domain],
-#             capture_output=True, text=True, timeout=10
-#         )
-        
-#         if 'SPAM' in result.stdout:
-#             return True
-#         elif 'HAM' in result.stdout:
-#             return False
-#         else:
-#             return None
-            
-#     except Exception as e:
-#         logger.debug(f"Blockchain query failed for {domain}: {e}")
-#         return None
-
-
-# def check_url_reputation(url):
-#     """
-#     Check URL reputation using blockchain
-#     Returns: 'spam', 'ham', 'unknown'
-#     """
-#     domain = extract_domain_from_url(url)
-#     reputation = check_domain_reputation(domain)
-    
-#     if reputation is True:
-#         return 'spam'
-#     elif reputation is False:
-#         return 'ham'
-#     else:
-#         return 'unknown'
+    # Without Numba: one bincount over (segment, byte) pairs, then pick the target bytes
+    offsets = np.repeat(np.arange(len(encoded), dtype=np.intp) * 256, lengths)
+    histogram = np.bincount(offsets + data, minlength=len(encoded) * 256).reshape(len(encoded), 256)
+    return histogram[:, _COUNTED_CHAR_BYTES].tolist()
 
+# Compile (or load the cached machine code) now rather than on the first request
+if njit is not None:
+    try:
+        count_segment_chars(['http://warm.up/?a=1'])
+    except Exception as e:
+        logger.warning(f"Numba char counting unavailable, using np.bincount: {e}")
+        njit = None
+
+def extract_features(url):
+    """
+    Extracts common features from a given URL string.
+
+    Args:
+        url (str): The URL string to extract features from.
+
+    Returns:
+        tuple: A tuple of (features, parsed). The first five features are the raw
+        URL_CATEGORICAL_FIELDS values, the rest line up with URL_NUMERIC_FEATURES.
+    """
+    parsed = urlparse(url)
+
+    domain = parsed.hostname or ""
+    path = parsed.path or ""
+    query = parsed.query or ""
+    scheme = parsed.scheme or ""
+    netloc = parsed.netloc or ""
+    hostname = parsed.hostname or ""
+    port = parsed.port or -1
+
+    full = url
+    file_name = path.split('/')[-1]
+    feature_list = []
+
+    n_special = len(special_chars)
+    url_counts, domain_counts, path_counts, file_counts, query_counts = count_segment_chars(
+        [full, domain, path, file_name, query]
+    )
+
+    # Raw parsed fields
+    feature_list.extend([scheme, netloc, path, query, hostname, port])
+
+    # URL level
+    feature_list.extend(url_counts[:n_special])
+    feature_list.append(len(full))  # length_url
+
+    # Domain level
+    feature_list.extend(domain_counts[:n_special])
+    feature_list.append(sum(domain_counts[n_special:]))  # qty_vowels_domain
+    feature_list.append(len(domain))
+    feature_list.append(1 if _IPV4_HOST.match(domain) else 0)
+    feature_list.append(1 if 'client' in domain or 'server' in domain else 0)
+
+    # Directory level
+    feature_list.extend(path_counts[:n_special])
+    feature_list.append(len(path))
+
+    # File level
+    feature_list.extend(file_counts[:n_special])
+    feature_list.append(len(file_name))
+
+    # Params level
+    feature_list.extend(query_counts[:n_special])
+    feature_list.append(len(query))
+    feature_list.append(1 if _TLD_IN_QUERY.search(query) else 0)
+    feature_list.append(len(query.split('&')) if query else 0)
+    feature_list.append(1 if _EMAIL_IN_URL.search(url) else 0)
+
+    return feature_list, parsed
 
 def extract_localhost_features(url):
     """Extract features for localhost URLs"""
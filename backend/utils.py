@@ -1,66 +1,296 @@
 import os
+import contextlib
 import subprocess
 import logging
 import warnings
-import pandas as pd
 import pickle
 import re
+import html
+import hashlib
+import threading
+import time
 import numpy as np
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from email import policy
 from email.parser import BytesParser
-from urllib.parse import urlparse
 from typing import Dict, Any, Optional, List, Tuple
 
 # Suppress warnings
 from sklearn.exceptions import InconsistentVersionWarning
 warnings.filterwarnings("ignore", category=InconsistentVersionWarning)
+# URL model is fed a plain ndarray aligned to X_train_encoded_columns on purpose
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
 
 logger = logging.getLogger(__name__)
 
+from blockchain_integration import get_blockchain_worker
+
+# C-backed HTML parser for stripping markup before tokenization (optional)
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
+
+# RE2 (linear-time DFA) for the URL presence check (optional)
+try:
+    import re2
+except ImportError:
+    re2 = None
+
 # Load models and data
 try:
     with open('files/X_train_encoded_columns.pkl', 'rb') as f:
         X_train_encoded_columns = pickle.load(f)
     logger.info("✅ Loaded encoded columns")
 except Exception as e:
-    logger.error(f"❌ Failed to load encoded columns: {e}")
+    logger.error("❌ Failed to load encoded columns: %s", e)
     X_train_encoded_columns = []
 
 # Import URL utilities
 try:
-    from url_utils import extract_localhost_features, extract_generic_features
+    from url_utils import extract_features, URL_CATEGORICAL_FIELDS, URL_NUMERIC_FEATURES
     logger.info("✅ Loaded URL utilities")
 except ImportError as e:
-    logger.warning(f"⚠️ URL utilities not available: {e}")
-    def extract_localhost_features(url): return []
-    def extract_generic_features(url): return []
+    logger.warning("⚠️ URL utilities not available: %s", e)
+    def extract_features(url): return [], None
+    URL_CATEGORICAL_FIELDS, URL_NUMERIC_FEATURES = [], []
 
-# Load URL model
-try:
-    with open('files/random_forest_url_model.pkl', 'rb') as f:
-        url_model = pickle.load(f)
-    logger.info("✅ Loaded URL model")
-except Exception as e:
-    logger.error(f"❌ Failed to load URL model: {e}")
-    url_model = None
+# Column positions in the URL model's training matrix, built once instead of
+# aligning a one-hot DataFrame per URL
+URL_COL_INDEX = {col: i for i, col in enumerate(X_train_encoded_columns)}
+N_URL_COLS = len(X_train_encoded_columns)
+_url_numeric_pairs = [(i, URL_COL_INDEX[name]) for i, name in enumerate(URL_NUMERIC_FEATURES) if name in URL_COL_INDEX]
+_URL_NUMERIC_SRC = np.array([src for src, _ in _url_numeric_pairs], dtype=np.intp)
+_URL_NUMERIC_DST = np.array([dst for _, dst in _url_numeric_pairs], dtype=np.intp)
+# Per categorical field: raw value -> one-hot column ("<field>_<value>" in training)
+_URL_ONEHOT_INDEX = [{} for _ in URL_CATEGORICAL_FIELDS]
+_url_numeric_names = set(URL_NUMERIC_FEATURES)
+for _col, _idx in URL_COL_INDEX.items():
+    if _col in _url_numeric_names:
+        continue
+    for _field_values, _field in zip(_URL_ONEHOT_INDEX, URL_CATEGORICAL_FIELDS):
+        if _col.startswith(_field + '_'):
+            _field_values[_col[len(_field) + 1:]] = _idx
+            break
 
-# Load embedding model and classifier
-try:
-    from sentence_transformers import SentenceTransformer
-    embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-    logger.info("✅ Loaded embedding model")
-except Exception as e:
-    logger.error(f"❌ Failed to load embedding model: {e}")
+class OnnxUrlModel:
+    """URL random forest compiled to ONNX; drop-in for predict_proba on float32 input
+
+    Expects the output of `export_onnx_models.py url`.
+    """
+    
+    def __init__(self, model_path: str):
+        import onnxruntime as ort
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # A few rows per call: one non-spinning thread leaves the cores to the
+        # embedding model, which scores the same email concurrently
+        options.intra_op_num_threads = URL_MODEL_THREADS
+        options.inter_op_num_threads = 1
+        options.add_session_config_entry("session.intra_op.allow_spinning", "0")
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+    
+    def predict_proba(self, X) -> np.ndarray:
+        # Outputs are (label, probabilities)
+        return self.session.run(None, {self.input_name: np.asarray(X, dtype=np.float32)})[1]
+
+URL_MODEL_ONNX_PATH = 'files/random_forest_url_model.onnx'
+URL_MODEL_THREADS = int(os.environ.get("URL_MODEL_THREADS", "1"))
+
+# Load URL model (compiled ONNX tree ensemble if exported, else sklearn)
+url_model = None
+if os.path.exists(URL_MODEL_ONNX_PATH):
+    try:
+        url_model = OnnxUrlModel(URL_MODEL_ONNX_PATH)
+        logger.info("✅ Loaded ONNX URL model")
+    except Exception as e:
+        logger.warning("⚠️ ONNX URL model not available, using sklearn: %s", e)
+
+if url_model is None:
+    try:
+        with open('files/random_forest_url_model.pkl', 'rb') as f:
+            url_model = pickle.load(f)
+        logger.info("✅ Loaded URL model")
+    except Exception as e:
+        logger.error("❌ Failed to load URL model: %s", e)
+        url_model = None
+
+# Roughly one thread per physical core for the embedding runtimes (override with EMBEDDING_THREADS)
+EMBEDDING_THREADS = int(os.environ.get("EMBEDDING_THREADS", max(1, (os.cpu_count() or 2) // 2)))
+# int8 encoder (quantized ONNX export, or dynamic quantization of the PyTorch Linear layers);
+# opt-in, since the content classifier was trained on FP32 embeddings and agreement is not yet measured
+QUANTIZE_EMBEDDING_MODEL = os.environ.get("QUANTIZE_EMBEDDING_MODEL", "false").lower() == "true"
+
+# torch.inference_mode when the PyTorch encoder is used, no-op otherwise
+_inference_mode = contextlib.nullcontext
+
+class OnnxSentenceEncoder:
+    """MiniLM served by onnxruntime; drop-in for SentenceTransformer.encode
+
+    Expects the output of `export_onnx_models.py encoder` (model + tokenizer files) in model_dir;
+    model_file picks the FP32 (model.onnx) or int8 (model_quantized.onnx) graph.
+    """
+    
+    def __init__(self, model_dir: str, model_file: str = 'model.onnx', max_length: int = 256):
+        import onnxruntime as ort
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = EMBEDDING_THREADS
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file),
+            sess_options=options,
+            providers=['CPUExecutionProvider']
+        )
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.max_length = max_length
+        
+        # The Rust `tokenizers` runtime reads tokenizer.json directly; importing
+        # transformers just for AutoTokenizer costs seconds of startup
+        self.fast_tokenizer = None
+        self.tokenizer = None
+        try:
+            from tokenizers import Tokenizer
+            self.fast_tokenizer = Tokenizer.from_file(os.path.join(model_dir, 'tokenizer.json'))
+            self.fast_tokenizer.enable_truncation(max_length=max_length)
+            pad_id = self.fast_tokenizer.token_to_id('[PAD]')
+            self.fast_tokenizer.enable_padding(pad_id=pad_id or 0, pad_token='[PAD]')
+        except Exception:
+            from transformers import AutoTokenizer
+            self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    
+    def _tokenize(self, sentences) -> Dict[str, np.ndarray]:
+        if self.fast_tokenizer is None:
+            return self.tokenizer(
+                list(sentences),
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors='np'
+            )
+        encodings = self.fast_tokenizer.encode_batch(list(sentences))
+        return {
+            'input_ids': np.array([e.ids for e in encodings], dtype=np.int64),
+            'attention_mask': np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            'token_type_ids': np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+    
+    def encode(self, sentences, batch_size: int = 32, **kwargs) -> np.ndarray:
+        """Mean-pooled, L2-normalized embeddings (same as all-MiniLM-L6-v2 in sentence-transformers)"""
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        batches = []
+        for start in range(0, len(sentences), batch_size):
+            tokens = self._tokenize(sentences[start:start + batch_size])
+            feeds = {}
+            for name in self.input_names:
+                if name in tokens:
+                    feeds[name] = tokens[name].astype(np.int64)
+                else:
+                    feeds[name] = np.zeros_like(tokens['input_ids'], dtype=np.int64)
+            hidden = self.session.run(None, feeds)[0]
+            mask = tokens['attention_mask'][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype(np.float32))
+        return np.vstack(batches) if batches else np.zeros((0, 384), dtype=np.float32)
+
+ONNX_ENCODER_DIR = 'files/minilm_onnx'
+
+def _load_embedding_model():
+    """ONNX encoder if exported, else PyTorch MiniLM (None if neither loads)"""
+    global _inference_mode
     embedding_model = None
+    onnx_file = 'model_quantized.onnx' if QUANTIZE_EMBEDDING_MODEL else 'model.onnx'
+    if os.path.exists(os.path.join(ONNX_ENCODER_DIR, onnx_file)):
+        try:
+            embedding_model = OnnxSentenceEncoder(ONNX_ENCODER_DIR, onnx_file)
+            logger.info("✅ Loaded ONNX %s embedding model", "int8" if QUANTIZE_EMBEDDING_MODEL else "FP32")
+        except Exception as e:
+            logger.warning("⚠️ ONNX embedding model not available, using PyTorch: %s", e)
+
+    if embedding_model is None:
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+            torch.set_num_threads(EMBEDDING_THREADS)
+            try:
+                torch.set_num_interop_threads(1)
+            except RuntimeError:
+                pass  # Already set (can only be set once per process)
+            # Dynamic int8 quantization is a CPU-only kernel path
+            embedding_model = SentenceTransformer('all-MiniLM-L6-v2', device='cpu')
+            embedding_model.eval()
+            if QUANTIZE_EMBEDDING_MODEL:
+                try:
+                    transformer = embedding_model[0]
+                    transformer.auto_model = torch.ao.quantization.quantize_dynamic(
+                        transformer.auto_model, {torch.nn.Linear}, dtype=torch.qint8
+                    )
+                    logger.info("✅ Quantized embedding model to int8")
+                except Exception as e:
+                    logger.warning("⚠️ int8 quantization unavailable, using FP32 embedding model: %s", e)
+            _inference_mode = torch.inference_mode
+            logger.info("✅ Loaded embedding model")
+        except Exception as e:
+            logger.error("❌ Failed to load embedding model: %s", e)
+            embedding_model = None
+    return embedding_model
+
+# The encoder (and torch / sentence-transformers behind it) is loaded on first use,
+# so importing this module for parsing or URL helpers stays cheap
+_embedding_model = None
+_embedding_model_loaded = False
+_model_load_lock = threading.Lock()
+
+def get_embedding_model():
+    """Embedding model, loaded on first call"""
+    global _embedding_model, _embedding_model_loaded
+    if not _embedding_model_loaded:
+        with _model_load_lock:
+            if not _embedding_model_loaded:
+                _embedding_model = _load_embedding_model()
+                _embedding_model_loaded = True
+    return _embedding_model
 
 try:
     with open('files/email_log_reg_embed_model.pkl', 'rb') as f:
         content_model = pickle.load(f)
     logger.info("✅ Loaded content model")
 except Exception as e:
-    logger.error(f"❌ Failed to load content model: {e}")
+    logger.error("❌ Failed to load content model: %s", e)
     content_model = None
 
+# Column of predict_proba holding P(spam), resolved once from the classifier's labels
+try:
+    _SPAM_INDEX = list(content_model.classes_).index("spam")
+except Exception:
+    _SPAM_INDEX = -1
+
+# Binary logistic regression scored directly as sigmoid(X @ w + b), skipping sklearn's
+# per-call validation; w/b are oriented so the sigmoid is P(spam)
+_content_w = None
+_content_b = 0.0
+try:
+    if content_model is not None and getattr(content_model, 'coef_', None) is not None and content_model.coef_.shape[0] == 1:
+        _spam_sign = 1.0 if _SPAM_INDEX in (1, -1) else -1.0
+        _content_w = _spam_sign * content_model.coef_[0].astype(np.float64)
+        _content_b = _spam_sign * float(content_model.intercept_[0])
+except Exception as e:
+    logger.warning("⚠️ Using predict_proba for content model: %s", e)
+    _content_w = None
+
+def _content_spam_proba(embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(P(spam), confidence) per embedding row"""
+    if _content_w is None:
+        probas = content_model.predict_proba(embeddings)
+        return probas[:, _SPAM_INDEX], probas.max(axis=1)
+    spam_probs = 1.0 / (1.0 + np.exp(-(embeddings @ _content_w + _content_b)))
+    return spam_probs, np.maximum(spam_probs, 1.0 - spam_probs)
+
 # LLM setup
 from dotenv import load_dotenv
 load_dotenv()
@@ -68,23 +298,242 @@ load_dotenv()
 GENINI_MODEL_NAME = "gemini-2.5-flash"
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-if GEMINI_API_KEY:
+def _load_llm_model():
+    """Gemini client (None without GEMINI_API_KEY or google-generativeai)"""
+    if not GEMINI_API_KEY:
+        logger.warning("⚠️ GEMINI_API_KEY not found")
+        return None
     try:
         import google.generativeai as genai
         genai.configure(api_key=GEMINI_API_KEY)
         llm_model = genai.GenerativeModel(GENINI_MODEL_NAME)
         logger.info("✅ LLM model configured")
+        return llm_model
     except Exception as e:
-        logger.error(f"❌ Failed to configure LLM: {e}")
-        llm_model = None
-else:
-    logger.warning("⚠️ GEMINI_API_KEY not found")
-    llm_model = None
+        logger.error("❌ Failed to configure LLM: %s", e)
+        return None
+
+# google.generativeai (grpc, protobuf) is also imported on first use
+_llm_model = None
+_llm_model_loaded = False
+
+def get_llm_model():
+    """Gemini model, configured on first call"""
+    global _llm_model, _llm_model_loaded
+    if not _llm_model_loaded:
+        with _model_load_lock:
+            if not _llm_model_loaded:
+                _llm_model = _load_llm_model()
+                _llm_model_loaded = True
+    return _llm_model
+
+def warm_up_models():
+    """Load the lazily-initialised models now (server startup, before the first request)"""
+    get_embedding_model()
+    get_llm_model()
 
 # Constants
 MAX_RETRIES = 3
 DEFAULT_TIMEOUT = 30
 
+# Shared pool for the independent per-email analyses (model inference releases the GIL)
+_analysis_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="analysis")
+# Separate pool for IO-bound blockchain lookups so they never queue behind inference
+_blockchain_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="blockchain")
+# Whole-email tasks in compute_final_risk_batch (mostly waiting on Gemini); kept apart
+# from _analysis_executor because those tasks may submit work to it and wait
+_batch_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="batch")
+_FAST_PATH_BODY_LEN = 200  # Short emails without links skip the LLM round-trip
+
+class LRUCache:
+    """Small thread-safe LRU map; module-level instances are shared by all request threads
+    
+    With ttl (seconds) set, entries older than ttl are treated as missing; ttl <= 0
+    disables the cache (put stores nothing).
+    """
+    
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at or None, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] is not None and entry[0] <= time.monotonic():
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return entry[1]
+    
+    def put(self, key, value):
+        if self.ttl is not None and self.ttl <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+    
+    def __len__(self):
+        return len(self._data)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+class SemanticCache:
+    """Thread-safe near-duplicate lookup: a value is reused when its exact key matches
+    and its unit-length vector is within `threshold` cosine similarity of the query
+    
+    Vectors live in one preallocated ring buffer, so a lookup is a single matmul.
+    ttl <= 0 disables the cache, as for LRUCache.
+    """
+    
+    def __init__(self, maxsize: int, threshold: float, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl = ttl
+        self._vectors = None  # (maxsize, dim) float32, allocated on first put
+        self._keys = [None] * maxsize
+        self._values = [None] * maxsize
+        self._expires = np.full(maxsize, np.inf)
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, vector: np.ndarray, key, default=None):
+        with self._lock:
+            if self._size:
+                similarities = self._vectors[:self._size] @ vector
+                similarities[self._expires[:self._size] <= time.monotonic()] = -np.inf
+                for i in np.argsort(similarities)[::-1]:
+                    if similarities[i] < self.threshold:
+                        break
+                    if self._keys[i] == key:
+                        self.hits += 1
+                        return self._values[i]
+            self.misses += 1
+            return default
+    
+    def put(self, vector: np.ndarray, key, value):
+        if self.ttl is not None and self.ttl <= 0:
+            return
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.maxsize, vector.shape[0]), dtype=np.float32)
+            slot = self._next
+            self._vectors[slot] = vector
+            self._keys[slot] = key
+            self._values[slot] = value
+            self._expires[slot] = time.monotonic() + self.ttl if self.ttl is not None else np.inf
+            self._next = (slot + 1) % self.maxsize
+            self._size = min(self._size + 1, self.maxsize)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": self._size,
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+# Repeated URLs (newsletters, tracking links) and identical bodies skip the models
+_url_score_cache = LRUCache(maxsize=4096)
+_content_result_cache = LRUCache(maxsize=4096)
+# MiniLM vectors (384 float32 = 1.5 KB each), keyed on whitespace-normalized text
+_embedding_cache = LRUCache(maxsize=4096)
+# Gemini verdicts for repeated emails (only successful calls are stored); the TTL
+# lets a verdict be re-evaluated after a day (model updates, changed campaigns)
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", "86400"))
+_llm_result_cache = LRUCache(maxsize=1024, ttl=LLM_CACHE_TTL)
+# Same sender + subject + link domains and a near-identical body (re-sends, per-recipient tokens) reuse
+# the verdict; keyed on the MiniLM body vector the content model already computed
+LLM_SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("LLM_SEMANTIC_CACHE_THRESHOLD", "0.97"))
+_llm_semantic_cache = SemanticCache(maxsize=1024, threshold=LLM_SEMANTIC_CACHE_THRESHOLD, ttl=LLM_CACHE_TTL)
+# On-chain sender reputations; the TTL bounds how stale a record seen by another
+# instance can get, writes from this process update the entry directly
+BLOCKCHAIN_CACHE_TTL = float(os.environ.get("BLOCKCHAIN_CACHE_TTL", "3600"))
+_reputation_cache = LRUCache(maxsize=10000, ttl=BLOCKCHAIN_CACHE_TTL)
+
+def _content_key(content: str) -> bytes:
+    return hashlib.blake2b(content.encode('utf-8', 'ignore'), digest_size=16).digest()
+
+def _embedding_key(content: str) -> bytes:
+    # The tokenizer splits on whitespace, so runs of it never change the embedding
+    return _content_key(_WHITESPACE_RE.sub(' ', content).strip())
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Size and hit/miss counters of the in-process caches"""
+    return {
+        "url_scores": _url_score_cache.stats(),
+        "content_results": _content_result_cache.stats(),
+        "embeddings": _embedding_cache.stats(),
+        "llm_results": _llm_result_cache.stats(),
+        "llm_semantic": _llm_semantic_cache.stats(),
+        "blockchain_reputations": _reputation_cache.stats(),
+    }
+
+# URL patterns, compiled once
+_HTTP_URL_RE = re.compile(r'https?://[^\s<>"{}|\\^`\[\]]+', re.IGNORECASE)
+# Bare www. links only; a www. inside "https://www..." is already matched above
+_WWW_URL_RE = re.compile(r'(?<![/\w.])www\.[^\s<>"{}|\\^`\[\]]+', re.IGNORECASE)
+_URL_TRAILING_PUNCT = '.,;!?'
+# Any link at all? Scanned once with RE2 so link-free bodies skip both passes above
+_URL_PRESENCE_RE = re2.compile(r'(?i)https?://|www\.') if re2 is not None else None
+
+# HTML stripping patterns
+_HTML_SCRIPT_STYLE_RE = re.compile(r'<(script|style)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+_WHITESPACE_RE = re.compile(r'\s+')
+# Host part of a URL in one pass (skips userinfo, stops at port/path/query/fragment)
+_URL_HOST_RE = re.compile(r'^[a-z][a-z0-9+.\-]*://(?:[^/?#@]*@)?([^/:?#]+)', re.IGNORECASE)
+_NUMBER_RE = re.compile(r'[0-9\.]+')
+
+# Body size budgets
+MAX_BODY_CHARS = 16384  # Parsed email bodies are capped here
+ENCODER_MAX_CHARS = 2048  # MiniLM only sees the first 256 tokens anyway
+
+def html_to_text(html_content: str) -> str:
+    """Cheap HTML to text: drop script/style blocks and tags, unescape entities"""
+    if HTMLParser is not None:
+        tree = HTMLParser(html_content)
+        for node in tree.css('script, style'):
+            node.decompose()
+        root = tree.body or tree.root
+        text = root.text(separator=' ') if root is not None else ''
+        return _WHITESPACE_RE.sub(' ', text).strip()
+    
+    # Regex fallback when selectolax is not installed
+    text = _HTML_SCRIPT_STYLE_RE.sub(' ', html_content)
+    text = _HTML_TAG_RE.sub(' ', text)
+    return _WHITESPACE_RE.sub(' ', html.unescape(text)).strip()
+
 def parse_email_content(raw_email: str) -> Dict[str, str]:
     """Parse raw email content and extract components"""
     try:
@@ -93,15 +542,15 @@ def parse_email_content(raw_email: str) -> Dict[str, str]:
         
         msg = BytesParser(policy=policy.default).parsebytes(raw_email)
         
-        # Extract text content
+        # Extract text content: first text/plain body, else text/html stripped to text
+        # (no full walk() over attachments / quoted parts), capped at MAX_BODY_CHARS
         body_text = ""
-        if msg.is_multipart():
-            for part in msg.walk():
-                if part.get_content_type() == "text/plain":
-                    body_text += part.get_content()
-        else:
-            if msg.get_content_type() == "text/plain":
-                body_text = msg.get_content()
+        body_part = msg.get_body(preferencelist=('plain', 'html'))
+        if body_part is not None:
+            body_text = body_part.get_content()
+            if body_part.get_content_type() == "text/html":
+                body_text = html_to_text(body_text)
+        body_text = body_text[:MAX_BODY_CHARS]
         
         return {
             "sender": msg.get("From", ""),
@@ -112,7 +561,7 @@ def parse_email_content(raw_email: str) -> Dict[str, str]:
             "reply_to": msg.get("Reply-To", "")
         }
     except Exception as e:
-        logger.error(f"Error parsing email: {e}")
+        logger.error("Error parsing email: %s", e)
         return {
             "sender": "",
             "subject": "",
@@ -126,102 +575,170 @@ def extract_urls_from_content(content: str) -> List[str]:
     """Extract URLs from email content"""
     if not content:
         return []
+    if _URL_PRESENCE_RE is not None and _URL_PRESENCE_RE.search(content) is None:
+        return []
     
-    # URL pattern to match http/https URLs
-    url_pattern = r'https?://[^\s<>"{}|\\^`\[\]]+'
-    urls = re.findall(url_pattern, content, re.IGNORECASE)
-    
-    # Also match www. URLs
-    www_pattern = r'www\.[^\s<>"{}|\\^`\[\]]+'
-    www_urls = re.findall(www_pattern, content, re.IGNORECASE)
+    # http/https URLs, trailing sentence punctuation trimmed
+    urls = [m.group(0).rstrip(_URL_TRAILING_PUNCT) for m in _HTTP_URL_RE.finditer(content)]
     
-    # Add http:// prefix to www URLs
-    www_urls = ['http://' + url for url in www_urls]
+    # Also match www. URLs, adding http:// prefix
+    urls.extend('http://' + m.group(0).rstrip(_URL_TRAILING_PUNCT) for m in _WWW_URL_RE.finditer(content))
     
-    return list(set(urls + www_urls))
-
-def extract_domains_from_urls(urls: List[str]) -> List[str]:
-    """Extract domains from list of URLs"""
-    domains = []
-    for url in urls:
-        try:
-            parsed = urlparse(url)
-            domain = parsed.netloc.lower()
-            if domain.startswith('www.'):
-                domain = domain[4:]
-            if domain and domain not in domains:
-                domains.append(domain)
-        except Exception as e:
-            logger.error(f"Error parsing URL {url}: {e}")
-    return domains
+    # Order-preserving dedup: repeated CTAs / tracking links are scored once
+    return list(dict.fromkeys(urls))
 
 def analyze_content_with_ml(content: str) -> Tuple[float, float]:
     """Analyze content using ML models"""
+    if not content or not content_model or not get_embedding_model():
+        logger.warning("Content analysis not available")
+        return 0.5, 0.5
+    return analyze_contents_with_ml([content])[0]
+
+def analyze_content_with_embedding(content: str) -> Tuple[Tuple[float, float], Optional[np.ndarray]]:
+    """analyze_content_with_ml plus the body embedding it was scored from (None if unavailable)"""
+    if not content or not content_model or not get_embedding_model():
+        logger.warning("Content analysis not available")
+        return (0.5, 0.5), None
     try:
-        if not content or not embedding_model or not content_model:
-            logger.warning("Content analysis not available")
-            return 0.5, 0.5
+        embedding = embed_contents([content[:ENCODER_MAX_CHARS]])[0]
+        spam_probs, confidences = _content_spam_proba(embedding[None, :])
+        return (float(spam_probs[0]), float(confidences[0])), embedding
+    except Exception as e:
+        logger.error("Error in ML content analysis: %s", e)
+        return (0.5, 0.5), None
+
+def embed_contents(contents: List[str], batch_size: int = 64) -> np.ndarray:
+    """(N, dim) embeddings; cached per text, misses encoded in length-sorted batches"""
+    keys = [_embedding_key(content) for content in contents]
+    rows = [_embedding_cache.get(key) for key in keys]
+    
+    # One encode per distinct text; positions sharing a key reuse its row
+    misses = {}
+    for i, row in enumerate(rows):
+        if row is None:
+            misses.setdefault(keys[i], []).append(i)
+    
+    # Smart batching: similar lengths share a batch, so padding stays small
+    order = sorted(misses, key=lambda key: len(contents[misses[key][0]]))
+    if order:
+        # Load first: on a cold call that is what sets _inference_mode to torch's
+        embedding_model = get_embedding_model()
+        with _inference_mode():
+            encoded = embedding_model.encode(
+                [contents[misses[key][0]] for key in order],
+                batch_size=batch_size,
+                show_progress_bar=False,
+                convert_to_numpy=True
+            )
+        for key, row in zip(order, encoded):
+            for i in misses[key]:
+                rows[i] = row
+            _embedding_cache.put(key, row)
+    return np.stack(rows)
+
+def analyze_contents_with_ml(contents: List[str], batch_size: int = 64) -> List[Tuple[float, float]]:
+    """Analyze many contents at once: length-sorted batched encode + one predict_proba"""
+    results = [(0.5, 0.5)] * len(contents)
+    try:
+        if not content_model or not get_embedding_model():
+            return results
         
-        # Generate embedding
-        embedding = embedding_model.encode([content])
+        # The encoder truncates long inputs anyway; don't tokenize text it would drop
+        contents = [content[:ENCODER_MAX_CHARS] if content else content for content in contents]
         
-        # Get prediction
-        proba = content_model.predict_proba(embedding)[0]
-        confidence = max(proba)
-        spam_prob = proba[1] if len(proba) > 1 else proba[0]
+        # Cached bodies are served directly; only misses are encoded
+        keys = {}
+        for i, content in enumerate(contents):
+            if content:
+                keys[i] = _content_key(content)
+                cached = _content_result_cache.get(keys[i])
+                if cached is not None:
+                    results[i] = cached
+                    del keys[i]
         
-        return spam_prob, confidence
+        order = list(keys)
+        if not order:
+            return results
+        embeddings = embed_contents([contents[i] for i in order], batch_size=batch_size)
+        
+        # Get predictions for the whole matrix
+        spam_probs, confidences = _content_spam_proba(embeddings)
+        for i, spam_prob, confidence in zip(order, spam_probs.tolist(), confidences.tolist()):
+            results[i] = (spam_prob, confidence)
+            _content_result_cache.put(keys[i], results[i])
+        return results
     except Exception as e:
-        logger.error(f"Error in ML content analysis: {e}")
-        return 0.5, 0.5
+        logger.error("Error in ML content analysis: %s", e)
+        return [(0.5, 0.5)] * len(contents)
+
+def score_urls_with_ml(urls: List[str]) -> np.ndarray:
+    """Per-URL phishing probabilities; cached per URL, misses scored in one batch"""
+    scores = np.empty(len(urls), dtype=np.float64)
+    misses = {}  # unique uncached URL -> positions it occupies in urls
+    for i, url in enumerate(urls):
+        cached = _url_score_cache.get(url)
+        if cached is None:
+            misses.setdefault(url, []).append(i)
+        else:
+            scores[i] = cached
+    
+    if misses:
+        miss_urls = list(misses)
+        miss_scores, failed = _predict_url_scores(miss_urls)
+        for url, score, url_failed in zip(miss_urls, miss_scores, failed):
+            scores[misses[url]] = score
+            if not url_failed:
+                _url_score_cache.put(url, float(score))
+    return scores
+
+def _predict_url_scores(urls: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """(scores, failed) from one batched predict_proba call; failed URLs score 0.5"""
+    # One (N, N_URL_COLS) matrix laid out like X_train_encoded_columns
+    features_matrix = np.zeros((len(urls), N_URL_COLS), dtype=np.float32)
+    failed = np.zeros(len(urls), dtype=bool)
+    n_categorical = len(URL_CATEGORICAL_FIELDS)
+    
+    # Python loop only gathers raw values; the matrix is filled in two vectorized writes
+    numeric_rows, numeric_idx = [], []
+    hot_rows, hot_cols = [], []
+    for i, url in enumerate(urls):
+        try:
+            features, _ = extract_features(url)
+            numeric_rows.append(features[n_categorical:])
+            numeric_idx.append(i)
+            
+            # One-hot columns; unseen values stay 0
+            for field_values, value in zip(_URL_ONEHOT_INDEX, features[:n_categorical]):
+                col = field_values.get(value)
+                if col is not None:
+                    hot_rows.append(i)
+                    hot_cols.append(col)
+        except Exception as e:
+            logger.error("Error analyzing URL %s: %s", url, e)
+            failed[i] = True
+    
+    if numeric_rows:
+        numeric = np.asarray(numeric_rows, dtype=np.float32)
+        features_matrix[np.ix_(numeric_idx, _URL_NUMERIC_DST)] = numeric[:, _URL_NUMERIC_SRC]
+    features_matrix[hot_rows, hot_cols] = 1
+    
+    scores = url_model.predict_proba(features_matrix)[:, 1]
+    scores[failed] = 0.5
+    return scores, failed
 
 def analyze_urls_with_ml(urls: List[str]) -> float:
     """Analyze URLs using ML model"""
     try:
-        if not urls or not url_model:
+        if not urls or not url_model or not N_URL_COLS:
             return 0.5
         
-        url_scores = []
-        for url in urls:
-            try:
-                # Extract features (simplified)
-                features = extract_generic_features(url) + extract_localhost_features(url)
-                if not features:
-                    features = [len(url), url.count('.'), url.count('/'), 0, 0]
-                
-                # Pad or truncate features to match model expectations
-                expected_features = 50  # Adjust based on your model
-                if len(features) < expected_features:
-                    features.extend([0] * (expected_features - len(features)))
-                else:
-                    features = features[:expected_features]
-                
-                # Get prediction
-                features_array = np.array(features).reshape(1, -1)
-                score = url_model.predict_proba(features_array)[0][1]
-                url_scores.append(score)
-            except Exception as e:
-                logger.error(f"Error analyzing URL {url}: {e}")
-                url_scores.append(0.5)
-        
-        return np.mean(url_scores) if url_scores else 0.5
+        return float(np.mean(score_urls_with_ml(urls)))
     except Exception as e:
-        logger.error(f"Error in URL analysis: {e}")
+        logger.error("Error in URL analysis: %s", e)
         return 0.5
 
-def analyze_with_llm(content: str, sender: str = "", subject: str = "") -> Tuple[float, str, float]:
-    """Analyze email using LLM"""
-    try:
-        if not llm_model:
-            return 0.5, "LLM not available", 0.5
-        
-        prompt = f"""
-        Analyze this email for phishing indicators. Provide a risk score from 0.0 (safe) to 1.0 (definitely phishing).
-
-        Subject: {subject}
-        From: {sender}
-        Content: {content[:1000]}...
-
+# Static instructions appended to every LLM prompt; built once instead of per call
+_LLM_PROMPT_TAIL = """
         Consider:
         1. Urgency and fear tactics
         2. Suspicious links or attachments
@@ -234,9 +751,78 @@ def analyze_with_llm(content: str, sender: str = "", subject: str = "") -> Tuple
         REASON: [brief explanation]
         CONFIDENCE: [0.0-1.0]
         """
+_LLM_FIELDS = ('RISK_SCORE:', 'REASON:', 'CONFIDENCE:')
+
+def _read_llm_reply(response) -> str:
+    """Text of a streamed Gemini reply, stopping once every requested field has a full line
+
+    Anything the model adds after the CONFIDENCE line is never waited for. Chunks without
+    text (e.g. a final safety-blocked one) are skipped, keeping what has already arrived.
+    """
+    text = ""
+    try:
+        for chunk in response:
+            try:
+                text += chunk.text
+            except ValueError:
+                continue
+            complete_lines = text[:text.rfind('\n') + 1]
+            if all(field in complete_lines for field in _LLM_FIELDS):
+                break
+    except Exception as e:
+        if not text:
+            raise
+        logger.warning("LLM stream ended early, using partial reply: %s", e)
+    return text
+
+def _embedding_of(content_future: Future) -> Future:
+    """Future of just the body vector from an analyze_content_with_embedding future"""
+    embedding = Future()
+    content_future.add_done_callback(
+        lambda f: embedding.set_result(f.result()[1] if f.exception() is None else None)
+    )
+    return embedding
+
+def analyze_with_llm(content: str, sender: str = "", subject: str = "",
+                     embedding=None) -> Tuple[float, str, float]:
+    """Analyze email using LLM
+
+    embedding: the body's MiniLM vector (or a Future of it), enables near-duplicate reuse.
+    A pending Future is never waited on before the Gemini call.
+    """
+    try:
+        llm_model = get_llm_model()
+        if not llm_model:
+            return 0.5, "LLM not available", 0.5
+        
+        # Fingerprint exactly what goes into the prompt
+        cache_key = _content_key(f"{sender}\x1f{subject}\x1f{content[:1000]}")
+        cached = _llm_result_cache.get(cache_key)
+        if cached is not None:
+            logger.info("LLM cache hit")
+            return cached
+        
+        # Near-duplicates only count when they link to the same domains: a known-good
+        # template re-sent with its link swapped must still reach the LLM
+        semantic_key = (sender, subject, tuple(sorted(set(extract_domains_from_urls(extract_urls_from_content(content))))))
+        ready_embedding = embedding
+        if isinstance(embedding, Future):
+            ready_embedding = embedding.result() if embedding.done() else None
+        if ready_embedding is not None:
+            cached = _llm_semantic_cache.get(ready_embedding, semantic_key)
+            if cached is not None:
+                logger.info("LLM semantic cache hit")
+                return cached
         
-        response = llm_model.generate_content(prompt)
-        text = response.text
+        prompt = f"""
+        Analyze this email for phishing indicators. Provide a risk score from 0.0 (safe) to 1.0 (definitely phishing).
+
+        Subject: {subject}
+        From: {sender}
+        Content: {content[:1000]}...
+""" + _LLM_PROMPT_TAIL
+        
+        text = _read_llm_reply(llm_model.generate_content(prompt, stream=True))
         
         # Parse response
         risk_score = 0.5
@@ -246,7 +832,7 @@ def analyze_with_llm(content: str, sender: str = "", subject: str = "") -> Tuple
         for line in text.split('\n'):
             if 'RISK_SCORE:' in line:
                 try:
-                    risk_score = float(re.findall(r'[0-9\.]+', line)[0])
+                    risk_score = float(_NUMBER_RE.findall(line)[0])
                     risk_score = max(0.0, min(1.0, risk_score))
                 except:
                     pass
@@ -254,75 +840,151 @@ def analyze_with_llm(content: str, sender: str = "", subject: str = "") -> Tuple
                 reason = line.split('REASON:')[-1].strip()
             elif 'CONFIDENCE:' in line:
                 try:
-                    confidence = float(re.findall(r'[0-9\.]+', line)[0])
+                    confidence = float(_NUMBER_RE.findall(line)[0])
                     confidence = max(0.0, min(1.0, confidence))
                 except:
                     pass
         
+        _llm_result_cache.put(cache_key, (risk_score, reason, confidence))
+        if isinstance(embedding, Future):
+            embedding = embedding.result()  # Finished long before the Gemini reply
+        if embedding is not None:
+            _llm_semantic_cache.put(embedding, semantic_key, (risk_score, reason, confidence))
         return risk_score, reason, confidence
     except Exception as e:
-        logger.error(f"Error in LLM analysis: {e}")
+        logger.error("Error in LLM analysis: %s", e)
         return 0.5, f"LLM analysis failed: {str(e)}", 0.5
 
+def _query_classification_subprocess(domain: str, script_path: str) -> str:
+    """One-off `node interact.js query` fallback; returns SPAM, HAM or the raw last line"""
+    # Use UTF-8 encoding to avoid Windows CP1252 Unicode errors
+    result = subprocess.run(
+        ['node', script_path, 'query', domain],
+        capture_output=True,
+        text=True,
+        encoding='utf-8',
+        errors='ignore',  # Ignore Unicode decode errors
+        timeout=15,  # Increased from 10 to 15 seconds
+        cwd=os.path.dirname(script_path)  # Set working directory to blockchain folder
+    )
+    
+    if result.returncode == 0 and result.stdout:
+        # Extract ONLY the last line (which is the classification)
+        # This ignores all the debug/emoji output from interact.js
+        lines = result.stdout.strip().split('\n')
+        logger.debug("Blockchain query output for %s: %d lines", domain, len(lines))
+        return lines[-1].strip() if lines else ''
+    
+    if result.stderr:
+        logger.warning("Blockchain query stderr: %s", result.stderr[:100])
+    return ''
+
+def _reputation_from_classification(classification: str) -> Dict:
+    """Reputation dict for a SPAM / HAM on-chain record"""
+    return {
+        "exists": True,
+        "reputation_score": 10 if classification == 'SPAM' else 90,
+        "consensus": classification.lower(),
+        "spam_votes": 1 if classification == 'SPAM' else 0,
+        "ham_votes": 1 if classification == 'HAM' else 0,
+        "total_reports": 1,
+        "source": "blockchain",
+        "from_previous_incident": True  # Flag to indicate this is from historical data
+    }
+
 def get_blockchain_domain_reputation(domain: str) -> Dict:
     """Get sender email reputation from blockchain (domain parameter name kept for compatibility)"""
     try:
+        cached = _reputation_cache.get(domain)
+        if cached is not None:
+            logger.info("Blockchain reputation cache hit for sender %s", domain)
+            return {**cached, "cached": True}
+        
         script_path = os.path.join(os.path.dirname(__file__), 'blockchain', 'interact.js')
         if not os.path.exists(script_path):
-            logger.warning(f"Blockchain script not found at: {script_path}")
+            logger.warning("Blockchain script not found at: %s", script_path)
             return {"exists": False}
         
-        # Use UTF-8 encoding to avoid Windows CP1252 Unicode errors
-        result = subprocess.run(
-            ['node', script_path, 'query', domain],
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='ignore',  # Ignore Unicode decode errors
-            timeout=15,  # Increased from 10 to 15 seconds
-            cwd=os.path.dirname(script_path)  # Set working directory to blockchain folder
-        )
-        
-        if result.returncode == 0 and result.stdout:
-            # Extract ONLY the last line (which is the classification)
-            # This ignores all the debug/emoji output from interact.js
-            lines = result.stdout.strip().split('\n')
-            classification = lines[-1].strip() if lines else ''
-            
-            logger.debug(f"Blockchain query output for {domain}: {len(lines)} lines, last='{classification}'")
-            
-            if classification in ['SPAM', 'HAM']:
-                logger.info(f"✅ Found blockchain record for sender {domain}: {classification}")
-                return {
-                    "exists": True,
-                    "reputation_score": 10 if classification == 'SPAM' else 90,
-                    "consensus": classification.lower(),
-                    "spam_votes": 1 if classification == 'SPAM' else 0,
-                    "ham_votes": 1 if classification == 'HAM' else 0,
-                    "total_reports": 1,
-                    "source": "blockchain",
-                    "from_previous_incident": True  # Flag to indicate this is from historical data
-                }
+        # Prefer the persistent worker; fall back to a one-off node process
+        worker = get_blockchain_worker()
+        if worker is not None:
+            response = worker.request({"op": "query", "domain": domain}, timeout=15)
+            record = response.get("result")
+            if not response.get("ok") or record is None:
+                logger.warning("Blockchain worker query failed: %s", str(response.get('error'))[:100])
+                classification = ''
+            elif record.get("exists"):
+                classification = 'SPAM' if record.get("isSpam") else 'HAM'
             else:
-                logger.info(f"No blockchain record for sender {domain} (got '{classification}')")
-                return {"exists": False}
+                classification = 'UNKNOWN'
         else:
-            if result.stderr:
-                logger.warning(f"Blockchain query stderr: {result.stderr[:100]}")
-            return {"exists": False}
+            classification = _query_classification_subprocess(domain, script_path)
+        
+        if classification in ['SPAM', 'HAM']:
+            logger.info("✅ Found blockchain record for sender %s: %s", domain, classification)
+            reputation = _reputation_from_classification(classification)
+        else:
+            logger.info("No blockchain record for sender %s (got '%s')", domain, classification)
+            reputation = {"exists": False}
+        
+        # Failed lookups are retried next time rather than cached as "no record"
+        if classification in ['SPAM', 'HAM', 'UNKNOWN']:
+            _reputation_cache.put(domain, reputation)
+        return reputation
     except subprocess.TimeoutExpired:
-        logger.warning(f"⏱️ Blockchain query timeout for {domain}")
+        logger.warning("⏱️ Blockchain query timeout for %s", domain)
         return {"exists": False}
     except Exception as e:
-        logger.error(f"Error querying blockchain: {e}")
+        logger.error("Error querying blockchain: %s", e)
         return {"exists": False}
 
+def _store_classification_subprocess(domain: str, classification: str, reason: str, script_path: str) -> Tuple[bool, str]:
+    """One-off `node interact.js classify` fallback; returns (success, error message)"""
+    # Use UTF-8 encoding to avoid Windows CP1252 Unicode errors
+    # Increased timeout to 60 seconds for blockchain transactions
+    result = subprocess.run(
+        ['node', script_path, 'classify', domain, classification, reason],
+        capture_output=True,
+        text=True,
+        encoding='utf-8',
+        errors='ignore',  # Ignore Unicode decode errors
+        timeout=60,  # Increased from 30 to 60 seconds
+        cwd=os.path.dirname(script_path)  # Set working directory to blockchain folder
+    )
+    
+    if result.returncode == 0:
+        return True, ""
+    return False, result.stderr[:200] if result.stderr else "Unknown error"
+
+def get_blockchain_reputations(senders: List[str]) -> Dict[str, Dict]:
+    """Reputation per distinct sender email, looked up concurrently"""
+    reputations = {}
+    futures = {_blockchain_executor.submit(get_blockchain_domain_reputation, sender): sender
+               for sender in dict.fromkeys(senders) if sender}
+    for future in as_completed(futures):
+        try:
+            reputations[futures[future]] = future.result()
+        except Exception as e:
+            logger.error("Error querying blockchain for %s: %s", futures[future], e)
+            reputations[futures[future]] = {"exists": False}
+    return reputations
+
+def clean_sender_email(sender: str) -> str:
+    """Bare lower-cased address from "Name <email@domain.com>" ("" without an @)"""
+    if not sender or '@' not in sender:
+        return ""
+    sender_email = sender
+    # Handle format like "Name <email@domain.com>"
+    if '<' in sender and '>' in sender:
+        sender_email = sender.split('<')[1].split('>')[0].strip()
+    return sender_email.lower()
+
 def store_classification_to_blockchain(domain: str, is_spam: bool, reason: str, final_risk_score: Optional[float] = None) -> Tuple[bool, str]:
     """Store sender email classification to blockchain (domain parameter name kept for compatibility)"""
     try:
         script_path = os.path.join(os.path.dirname(__file__), 'blockchain', 'interact.js')
         if not os.path.exists(script_path):
-            logger.warning(f"Blockchain script not found at: {script_path}")
+            logger.warning("Blockchain script not found at: %s", script_path)
             return False, "Blockchain script not available"
         
         classification = 'true' if is_spam else 'false'
@@ -330,59 +992,54 @@ def store_classification_to_blockchain(domain: str, is_spam: bool, reason: str,
         # Truncate reason to avoid command line length issues
         truncated_reason = reason[:200] if len(reason) > 200 else reason
         
-        logger.info(f"Attempting blockchain storage for sender email {domain} (spam={is_spam})")
-        
-        # Use UTF-8 encoding to avoid Windows CP1252 Unicode errors
-        # Increased timeout to 60 seconds for blockchain transactions
-        result = subprocess.run(
-            ['node', script_path, 'classify', domain, classification, truncated_reason],
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='ignore',  # Ignore Unicode decode errors
-            timeout=60,  # Increased from 30 to 60 seconds
-            cwd=os.path.dirname(script_path)  # Set working directory to blockchain folder
-        )
+        logger.info("Attempting blockchain storage for sender email %s (spam=%s)", domain, is_spam)
         
-        if result.returncode == 0:
-            logger.info(f"✅ Successfully stored sender email {domain} as {classification}")
+        # Prefer the persistent worker (it also serializes transactions from the
+        # shared wallet); fall back to a one-off node process
+        worker = get_blockchain_worker()
+        if worker is not None:
+            response = worker.request(
+                {"op": "classify", "domain": domain, "isSpam": is_spam, "reason": truncated_reason},
+                timeout=60
+            )
+            outcome = response.get("result") or {}
+            success = bool(response.get("ok") and outcome.get("success"))
+            error_msg = str(outcome.get("error") or response.get("error") or "Unknown error")[:200]
+        else:
+            success, error_msg = _store_classification_subprocess(domain, classification, truncated_reason, script_path)
+        
+        if success:
+            logger.info("✅ Successfully stored sender email %s as %s", domain, classification)
+            _reputation_cache.put(domain, _reputation_from_classification('SPAM' if is_spam else 'HAM'))
             return True, f"Sender email {domain} stored as {classification}"
         else:
-            error_msg = result.stderr[:200] if result.stderr else "Unknown error"
-            logger.error(f"❌ Failed to store {domain}: {error_msg}")
+            logger.error("❌ Failed to store %s: %s", domain, error_msg)
             return False, f"Storage failed: {error_msg}"
     except subprocess.TimeoutExpired:
-        logger.warning(f"⏱️ Blockchain storage timeout for {domain} - transaction may still complete")
+        logger.warning("⏱️ Blockchain storage timeout for %s - transaction may still complete", domain)
         return False, f"Blockchain transaction timeout (may still complete in background)"
     except Exception as e:
-        logger.error(f"Error storing to blockchain: {e}")
+        logger.error("Error storing to blockchain: %s", e)
         return False, f"Error: {e}"
 
-# def report_domain_to_blockchain(domain: str, is_spam: bool, reason: str, final_risk_score: Optional[float] = None) -> Tuple[bool, str]:
-#     """Report domain to blockchain - alias for store_classification_to_blockchain"""
-#     return store_classification_to_blockchain(domain, is_spam, reason, final_risk_score)
-
 def extract_domains_from_urls(urls: List[str]) -> List[str]:
     """Extract clean domains from list of URLs"""
     domains = []
+    seen = set()  # O(1) membership instead of scanning the list
     for url in urls:
-        try:
-            if not url.startswith(('http://', 'https://')):
-                url = 'http://' + url
-            parsed = urlparse(url)
-            if parsed.netloc:
-                domain = parsed.netloc.lower()
-                # Remove www. prefix
-                if domain.startswith('www.'):
-                    domain = domain[4:]
-                # Remove port if present
-                if ':' in domain:
-                    domain = domain.split(':')[0]
-                if domain:
-                    domains.append(domain)
-        except Exception as e:
-            logger.warning(f"Could not parse URL {url}: {e}")
+        if not url.startswith(('http://', 'https://')):
+            url = 'http://' + url
+        match = _URL_HOST_RE.match(url)
+        if not match:
+            logger.warning("Could not parse URL %s", url)
             continue
+        domain = match.group(1).lower()
+        # Remove www. prefix
+        if domain.startswith('www.'):
+            domain = domain[4:]
+        if domain and domain not in seen:
+            seen.add(domain)
+            domains.append(domain)
     return domains
 
 def extract_domain_from_email(email_address: str) -> Optional[str]:
@@ -394,7 +1051,7 @@ def extract_domain_from_email(email_address: str) -> Optional[str]:
             domain = domain.rstrip('>').strip()
             return domain if domain else None
     except Exception as e:
-        logger.warning(f"Could not extract domain from email {email_address}: {e}")
+        logger.warning("Could not extract domain from email %s: %s", email_address, e)
     return None
 
 def get_domains_from_analysis_result(analysis_result: Dict) -> List[str]:
@@ -404,42 +1061,44 @@ def get_domains_from_analysis_result(analysis_result: Dict) -> List[str]:
     2. URL domains from email body
     3. Domains from blockchain signals
     """
-    domains = []
+    seen = {}  # Ordered dedup: insertion order kept, one pass, no throwaway list
     try:
         # 1. Extract sender domain from email address
         sender = analysis_result.get("sender", "")
         if sender:
             sender_domain = extract_domain_from_email(sender)
             if sender_domain:
-                domains.append(sender_domain)
-                logger.debug(f"Extracted sender domain: {sender_domain}")
+                seen[sender_domain] = None
+                logger.debug("Extracted sender domain: %s", sender_domain)
         
         # 2. Extract from details if available
         details = analysis_result.get("details", {})
-        if "domains" in details:
-            domains.extend(details.get("domains", []))
+        for domain in details.get("domains", ()):
+            seen[domain] = None
         
         # 3. Extract from URLs
-        if "urls" in details:
-            extracted_domains = extract_domains_from_urls(details.get("urls", []))
-            domains.extend(extracted_domains)
+        for domain in extract_domains_from_urls(details.get("urls", ())):
+            seen[domain] = None
         
         # 4. Extract from blockchain_signals
         blockchain_signals = details.get("blockchain_signals", {})
         if blockchain_signals:
-            domain_classifications = blockchain_signals.get("domain_classifications", {})
-            domains.extend(domain_classifications.keys())
+            for domain in blockchain_signals.get("domain_classifications", {}):
+                seen[domain] = None
             
     except Exception as e:
-        logger.error(f"Error extracting domains from analysis result: {e}")
+        logger.error("Error extracting domains from analysis result: %s", e)
     
-    # Remove duplicates, empty strings, and None values
-    unique_domains = list(set(filter(None, domains)))
-    logger.info(f"Extracted {len(unique_domains)} unique domain(s): {unique_domains}")
+    # Drop empty strings and None values
+    unique_domains = [domain for domain in seen if domain]
+    logger.info("Extracted %d unique domain(s): %s", len(unique_domains), unique_domains)
     
     return unique_domains
 
-def compute_final_risk(body: str, sender: str = "", subject: str = "", force_llm: bool = False) -> Tuple[float, Dict[str, Any]]:
+def compute_final_risk(body: str, sender: str = "", subject: str = "", force_llm: bool = False,
+                       content_result: Optional[Tuple[float, float]] = None,
+                       url_result: Optional[float] = None,
+                       reputation_result: Optional[Dict] = None) -> Tuple[float, Dict[str, Any]]:
     """Compute final risk score using all available methods
     
     Args:
@@ -447,6 +1106,9 @@ def compute_final_risk(body: str, sender: str = "", subject: str = "", force_llm
         sender: Sender email address
         subject: Email subject
         force_llm: If True, always run LLM analysis even if blockchain data exists
+        content_result: Precomputed (content_prob, content_conf), e.g. from compute_final_risk_batch
+        url_result: Precomputed URL probability, e.g. from compute_final_risk_batch
+        reputation_result: Precomputed blockchain reputation of the sender, e.g. from compute_final_risk_batch
     """
     try:
         logger.info("Computing final risk score...")
@@ -462,11 +1124,23 @@ def compute_final_risk(body: str, sender: str = "", subject: str = "", force_llm
         # Extract URLs and domains
         full_content = f"{subject} {body}"
         urls = extract_urls_from_content(full_content)
-        logger.info(f"Extracted {len(urls)} URLs from content")
+        logger.info("Extracted %d URLs from content", len(urls))
         
         domains = extract_domains_from_urls(urls)
         
-        logger.info(f"Total URL domains found: {domains}")
+        logger.info("Total URL domains found: %s", domains)
+        
+        # Fast path: short email with no links - content ML is enough, skip the LLM
+        fast_path = not force_llm and not urls and len(body or "") < _FAST_PATH_BODY_LEN
+        
+        # ML Content / URL analysis (lightweight, always run) - started now so they
+        # overlap the blockchain lookup and the LLM round-trip below
+        content_future = None
+        url_future = None
+        if body and content_result is None:
+            content_future = _analysis_executor.submit(analyze_content_with_embedding, body)
+        if urls and url_result is None:
+            url_future = _analysis_executor.submit(analyze_urls_with_ml, urls)
         
         # ===== BLOCKCHAIN FIRST STRATEGY (CHECK SENDER EMAIL) =====
         # Check blockchain for SENDER EMAIL ONLY, not domains
@@ -480,17 +1154,12 @@ def compute_final_risk(body: str, sender: str = "", subject: str = "", force_llm
         from_previous_incident = False
         
         # Clean sender email
-        sender_email = sender
-        if sender and '@' in sender:
-            # Handle format like "Name <email@domain.com>"
-            if '<' in sender and '>' in sender:
-                sender_email = sender.split('<')[1].split('>')[0].strip()
-            sender_email = sender_email.lower()
-            
-            logger.info(f"🔍 Checking blockchain for sender email: {sender_email}")
-            reputation = get_blockchain_domain_reputation(sender_email)
+        sender_email = clean_sender_email(sender)
+        if sender_email:
+            logger.info("🔍 Checking blockchain for sender email: %s", sender_email)
+            reputation = reputation_result if reputation_result is not None else get_blockchain_domain_reputation(sender_email)
             sender_reputation = reputation
-            logger.info(f"Blockchain query for sender '{sender_email}': exists={reputation.get('exists', False)}, consensus={reputation.get('consensus', 'none')}")
+            logger.info("Blockchain query for sender '%s': exists=%s, consensus=%s", sender_email, reputation.get('exists', False), reputation.get('consensus', 'none'))
             
             if reputation.get("exists", False):
                 blockchain_found = True
@@ -517,28 +1186,39 @@ def compute_final_risk(body: str, sender: str = "", subject: str = "", force_llm
             llm_conf = 0.9
             # LLM score matches blockchain (0.0 for HAM, 1.0 for SPAM)
             llm_score = 1.0 if blockchain_spam_signal else 0.0
+        elif fast_path:
+            logger.info("fast_path=1 - short email without URLs, skipping LLM analysis")
+            llm_reason = "Short email without links - LLM analysis skipped"
         else:
             if blockchain_found and force_llm:
                 logger.info("⚠️ Blockchain data found but force_llm=True - running fresh LLM analysis...")
             else:
                 logger.info("⚠️ No blockchain data for sender - running LLM analysis...")
+            # The content model's body vector doubles as the LLM's near-duplicate cache key
+            # (batch callers have already encoded the body into the embedding cache); it is
+            # handed over as a Future so the Gemini call does not wait for the encode
+            body_embedding = None
+            if content_future:
+                body_embedding = _embedding_of(content_future)
+            elif body:
+                body_embedding = _embedding_cache.get(_embedding_key(body[:ENCODER_MAX_CHARS]))
+            
             # LLM Analysis (if blockchain not found OR force_llm is True)
-            llm_score, llm_reason, llm_conf = analyze_with_llm(body, sender, subject)
-            logger.info(f"LLM analysis: score={llm_score:.3f}, conf={llm_conf:.3f}")
+            llm_score, llm_reason, llm_conf = analyze_with_llm(body, sender, subject, embedding=body_embedding)
+            logger.info("LLM analysis: score=%.3f, conf=%.3f", llm_score, llm_conf)
             
             # If we forced LLM, reduce blockchain weight
             if blockchain_found and force_llm:
                 blockchain_weight = 0.2  # Lower weight when user explicitly requests fresh analysis
         
-        # ML Content Analysis (lightweight, always run)
+        # Collect ML Content / URL results
         if body:
-            content_prob, content_conf = analyze_content_with_ml(body)
-            logger.info(f"Content analysis: prob={content_prob:.3f}, conf={content_conf:.3f}")
+            content_prob, content_conf = content_future.result()[0] if content_future else content_result
+            logger.info("Content analysis: prob=%.3f, conf=%.3f", content_prob, content_conf)
         
-        # ML URL Analysis (lightweight, always run)
         if urls:
-            url_prob = analyze_urls_with_ml(urls)
-            logger.info(f"URL analysis: prob={url_prob:.3f}")
+            url_prob = url_future.result() if url_future else url_result
+            logger.info("URL analysis: prob=%.3f", url_prob)
         
         # Compute weighted final score
         if blockchain_found and not force_llm:
@@ -557,6 +1237,14 @@ def compute_final_risk(body: str, sender: str = "", subject: str = "", force_llm
                 'llm': 0.4,  # Trust fresh LLM analysis more
                 'blockchain': 0.2  # Some weight to blockchain history
             }
+        elif fast_path:
+            # No LLM run and no URLs - URL/LLM stay neutral (0.5) with low weight
+            weights = {
+                'content': 0.6,
+                'url': 0.2,
+                'llm': 0.2,
+                'blockchain': 0.0
+            }
         else:
             # When no blockchain data, rely on ML + LLM
             weights = {
@@ -585,7 +1273,7 @@ def compute_final_risk(body: str, sender: str = "", subject: str = "", force_llm
             weights['blockchain'] * blockchain_risk
         )
         
-        logger.info(f"Score breakdown: content={content_prob:.3f}*{weights['content']:.2f}, url={url_prob:.3f}*{weights['url']:.2f}, llm={llm_score:.3f}*{weights['llm']:.2f}, blockchain={blockchain_risk:.3f}*{weights['blockchain']:.2f}")
+        logger.info("Score breakdown: content=%.3f*%.2f, url=%.3f*%.2f, llm=%.3f*%.2f, blockchain=%.3f*%.2f", content_prob, weights['content'], url_prob, weights['url'], llm_score, weights['llm'], blockchain_risk, weights['blockchain'])
         
         # Prepare detailed results
         details = {
@@ -602,20 +1290,22 @@ def compute_final_risk(body: str, sender: str = "", subject: str = "", force_llm
             "blockchain_signals": {
                 "blockchain_available": blockchain_weight > 0,
                 "sender_classification": sender_classification,
-                "from_previous_incident": from_previous_incident
+                "from_previous_incident": from_previous_incident,
+                "cache_hits": 1 if sender_reputation.get("cached") else 0
             },
             "urls": urls,
             "domains": domains,
             "weights": weights,
             "sender": sender,
-            "force_llm_used": force_llm
+            "force_llm_used": force_llm,
+            "fast_path": fast_path
         }
         
-        logger.info(f"Final risk score: {final_risk:.3f}")
+        logger.info("Final risk score: %.3f", final_risk)
         return float(final_risk), details
         
     except Exception as e:
-        logger.error(f"Error computing final risk: {e}")
+        logger.error("Error computing final risk: %s", e)
         # Return safe defaults
         return 0.5, {
             "error": str(e),
@@ -631,4 +1321,51 @@ def compute_final_risk(body: str, sender: str = "", subject: str = "", force_llm
             "llm_reason": f"Error: {str(e)}",
             "urls": [],
             "domains": []
-        }
\ No newline at end of file
+        }
+
+def compute_final_risk_batch(emails: List[Dict[str, Any]], force_llm: bool = False) -> List[Tuple[float, Dict[str, Any]]]:
+    """Compute final risk for many emails, sharing the ML work across the batch
+    
+    Args:
+        emails: Dicts with "body" and optional "sender" / "subject"
+        force_llm: If True, always run LLM analysis even if blockchain data exists
+    
+    Content embeddings come from one length-sorted batched encode, all URLs are
+    scored with one predict_proba, sender lookups run concurrently and the per-email
+    LLM calls overlap each other.
+    """
+    bodies = [email.get("body", "") for email in emails]
+    content_results = analyze_contents_with_ml(bodies)
+    
+    # Same URL extraction as compute_final_risk, scored in one pass
+    email_urls = [extract_urls_from_content(f"{email.get('subject', '')} {email.get('body', '')}") for email in emails]
+    all_urls = [url for urls in email_urls for url in urls]
+    url_results = [None] * len(emails)
+    if all_urls and url_model is not None and N_URL_COLS:
+        try:
+            scores = score_urls_with_ml(all_urls)
+            start = 0
+            for i, urls in enumerate(email_urls):
+                if urls:
+                    url_results[i] = float(np.mean(scores[start:start + len(urls)]))
+                    start += len(urls)
+        except Exception as e:
+            logger.error("Error in batch URL analysis: %s", e)
+    
+    sender_emails = [clean_sender_email(email.get("sender", "")) for email in emails]
+    reputations = get_blockchain_reputations(sender_emails)
+    
+    futures = [
+        _batch_executor.submit(
+            compute_final_risk,
+            email.get("body", ""),
+            sender=email.get("sender", ""),
+            subject=email.get("subject", ""),
+            force_llm=force_llm,
+            content_result=content_results[i],
+            url_result=url_results[i],
+            reputation_result=reputations.get(sender_emails[i])
+        )
+        for i, email in enumerate(emails)
+    ]
+    return [future.result() for future in futures]